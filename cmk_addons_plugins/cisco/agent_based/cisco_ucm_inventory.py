@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# Copyright (C) 2019 Checkmk GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+from typing import NamedTuple
+
+from cmk.agent_based.v2 import (
+    AgentSection,
+    InventoryPlugin,
+    InventoryResult,
+    StringTable,
+    TableRow,
+)
+
+
+class CUCMPhones(NamedTuple):
+    model: str
+    firmware: str
+    devicepool: str
+    count: int
+
+
+Section = list[CUCMPhones]
+
+
+def parse_cisco_ucm_inventory(string_table: StringTable) -> Section:
+    return [
+        CUCMPhones(model, firmware, devicepool, int(count))
+        for model, firmware, devicepool, count in string_table
+    ]
+
+agent_section_cisco_ucm_inventory = AgentSection(
+    name="cisco_ucm_inventory",
+    parse_function=parse_cisco_ucm_inventory,
+)
+
+
+def inventory_cisco_ucm_inventory(section: Section) -> InventoryResult:
+    for phones in section:
+        yield TableRow(
+            path=["software", "applications", "cisco_ucm", "phones"],
+            key_columns={
+                "model": phones.model,
+                "firmware": phones.firmware,
+                "devicepool": phones.devicepool,
+            },
+            inventory_columns={
+                "count": phones.count,
+            },
+        )
+
+
+inventory_plugin_cisco_ucm_inventory = InventoryPlugin(
+    name="cisco_ucm_inventory",
+    inventory_function=inventory_cisco_ucm_inventory,
+)
@@ -15,6 +15,7 @@ from cmk.rulesets.v1.form_specs import (
     DictElement,
     Dictionary,
     FixedValue,
+    Float,
     Integer,
     migrate_to_password,
     Password,
@@ -87,6 +88,32 @@ def parameter_form() -> Dictionary:
                 ),
                 required=True,
             ),
+            "cache_trust": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Cache SSL trust"),
+                    help_text=Help(
+                        "Verify the server certificate once against the CA bundle and pin it. "
+                        "Later runs build their SSL context from the pinned certificate only "
+                        "instead of loading the whole CA bundle. The host name is still verified "
+                        "and the pin is renewed when the server certificate changes. Only used "
+                        "when SSL certificate checking is enabled."
+                    ),
+                    elements={
+                        "ca_file": DictElement(
+                            parameter_form=String(
+                                title=Title("CA file"),
+                                help_text=Help(
+                                    "Path of a CA file to verify the server certificate with "
+                                    "instead of the default CA bundle"
+                                ),
+                                custom_validate=(validators.LengthInRange(min_value=1),),
+                            ),
+                            required=False,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
             "timeout": DictElement(
                 parameter_form=Integer(
                     title=Title("Connect timeout"),
@@ -101,6 +128,179 @@ def parameter_form() -> Dictionary:
                 ),
                 required=False,
             ),
+            "adaptive_polling": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Adaptive polling"),
+                    help_text=Help(
+                        "Back off from polling CUCM while it is busy. When the average response "
+                        "time or the error rate of recent runs climbs above the given limits, "
+                        "the agent serves cached service states instead of querying the server "
+                        "and stretches its effective polling interval. It returns to the normal "
+                        "rate once the node recovers."
+                    ),
+                    elements={
+                        "latency": DictElement(
+                            parameter_form=Float(
+                                title=Title("Back off above average response time"),
+                                prefill=DefaultValue(5.0),
+                                custom_validate=(validators.NumberInRange(min_value=0.1),),
+                                unit_symbol="seconds",
+                            ),
+                            required=False,
+                        ),
+                        "error_rate": DictElement(
+                            parameter_form=Float(
+                                title=Title("Back off above error rate"),
+                                help_text=Help("Share of failed queries among recent runs (0 to 1)"),
+                                prefill=DefaultValue(0.5),
+                                custom_validate=(
+                                    validators.NumberInRange(min_value=0.0, max_value=1.0),
+                                ),
+                            ),
+                            required=False,
+                        ),
+                        "max_interval": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Maximum polling interval"),
+                                help_text=Help("Maximum age of cached data served while backing off"),
+                                prefill=DefaultValue(600),
+                                custom_validate=(validators.NumberInRange(min_value=60),),
+                                unit_symbol="seconds",
+                            ),
+                            required=False,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
+            "circuit_breaker": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Circuit breaker"),
+                    help_text=Help(
+                        "After the given number of consecutive failed queries the agent stops "
+                        "contacting the endpoint and fails fast with a clear error. After the "
+                        "cool-down a single probe query is sent; if it succeeds, normal polling "
+                        "resumes. Authentication errors use a separate, longer cool-down to avoid "
+                        "locking the API account."
+                    ),
+                    elements={
+                        "threshold": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Open after consecutive failures"),
+                                help_text=Help("Use 0 to disable the circuit breaker"),
+                                prefill=DefaultValue(3),
+                                custom_validate=(validators.NumberInRange(min_value=0),),
+                            ),
+                            required=False,
+                        ),
+                        "auth_cooldown": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Cool-down after authentication errors"),
+                                prefill=DefaultValue(3600),
+                                custom_validate=(validators.NumberInRange(min_value=0),),
+                                unit_symbol="seconds",
+                            ),
+                            required=False,
+                        ),
+                        "network_cooldown": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Cool-down after network or server errors"),
+                                prefill=DefaultValue(300),
+                                custom_validate=(validators.NumberInRange(min_value=0),),
+                                unit_symbol="seconds",
+                            ),
+                            required=False,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
+            "service_events": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Service states from syslog alarms"),
+                    help_text=Help(
+                        "Read the service states from the table kept by the syslog listener "
+                        "(cisco_ucm_syslog_listener), which receives the service start/stop "
+                        "alarms forwarded by CUCM. A full query of the Control Center Services "
+                        "API is done only for periodic reconciliation."
+                    ),
+                    elements={
+                        "reconcile_interval": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Reconciliation interval"),
+                                prefill=DefaultValue(3600),
+                                custom_validate=(validators.NumberInRange(min_value=60),),
+                                unit_symbol="seconds",
+                            ),
+                            required=False,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
+            "inventory": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Phone inventory via AXL"),
+                    help_text=Help(
+                        "Collect the model, firmware load and device pool of the phones via "
+                        "AXL SQL queries. The queries are chunked to stay within the AXL limits "
+                        "and only devices changed since the last collection are queried in "
+                        "detail. The API user needs AXL access."
+                    ),
+                    elements={
+                        "axl_version": DictElement(
+                            parameter_form=String(
+                                title=Title("AXL API version"),
+                                prefill=DefaultValue("12.5"),
+                                custom_validate=(validators.LengthInRange(min_value=1),),
+                            ),
+                            required=False,
+                        ),
+                        "interval": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Collection interval"),
+                                prefill=DefaultValue(3600),
+                                custom_validate=(validators.NumberInRange(min_value=60),),
+                                unit_symbol="seconds",
+                            ),
+                            required=False,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
+            "deadlines": DictElement(
+                parameter_form=Dictionary(
+                    title=Title("Collector deadlines"),
+                    help_text=Help(
+                        "The services and the inventory are collected concurrently. A collector "
+                        "exceeding its deadline only drops its own section from the agent output."
+                    ),
+                    elements={
+                        "services": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Services"),
+                                help_text=Help("Default is twice the connect timeout"),
+                                prefill=DefaultValue(120),
+                                custom_validate=(validators.NumberInRange(min_value=1),),
+                                unit_symbol="seconds",
+                            ),
+                            required=False,
+                        ),
+                        "inventory": DictElement(
+                            parameter_form=Integer(
+                                title=Title("Phone inventory"),
+                                help_text=Help("Default is four times the connect timeout"),
+                                prefill=DefaultValue(240),
+                                custom_validate=(validators.NumberInRange(min_value=1),),
+                                unit_symbol="seconds",
+                            ),
+                            required=False,
+                        ),
+                    },
+                ),
+                required=False,
+            ),
         },
     )
 
@@ -15,6 +15,42 @@ from cmk.server_side_calls.v1 import (
 )
 
 
+class AdaptivePollingParams(BaseModel):
+    """adaptive polling validator"""
+    latency: float | None = None
+    error_rate: float | None = None
+    max_interval: int | None = None
+
+
+class CircuitBreakerParams(BaseModel):
+    """circuit breaker validator"""
+    threshold: int | None = None
+    auth_cooldown: int | None = None
+    network_cooldown: int | None = None
+
+
+class ServiceEventsParams(BaseModel):
+    """service events validator"""
+    reconcile_interval: int | None = None
+
+
+class InventoryParams(BaseModel):
+    """inventory validator"""
+    axl_version: str | None = None
+    interval: int | None = None
+
+
+class CacheTrustParams(BaseModel):
+    """ssl trust cache validator"""
+    ca_file: str | None = None
+
+
+class DeadlinesParams(BaseModel):
+    """collector deadlines validator"""
+    services: int | None = None
+    inventory: int | None = None
+
+
 class Params(BaseModel):
     """params validator"""
     user: str
@@ -25,7 +61,13 @@ class Params(BaseModel):
         | tuple[Literal["hostname"], None]
         | tuple[Literal["custom_hostname"], str]
     )
+    cache_trust: CacheTrustParams | None = None
     timeout: int | None = None
+    adaptive_polling: AdaptivePollingParams | None = None
+    circuit_breaker: CircuitBreakerParams | None = None
+    service_events: ServiceEventsParams | None = None
+    inventory: InventoryParams | None = None
+    deadlines: DeadlinesParams | None = None
 
 
 def commands_function(params: Params, host_config: HostConfig) -> Iterable[SpecialAgentCommand]:
@@ -36,6 +78,40 @@ def commands_function(params: Params, host_config: HostConfig) -> Iterable[Speci
     command_arguments += [params.secret.unsafe("-s=%s")]
     if params.timeout:
         command_arguments += ["-t", str(params.timeout)]
+    if params.adaptive_polling is not None:
+        command_arguments += ["--adaptive-polling"]
+        if params.adaptive_polling.latency is not None:
+            command_arguments += ["--backoff-latency", str(params.adaptive_polling.latency)]
+        if params.adaptive_polling.error_rate is not None:
+            command_arguments += ["--backoff-error-rate", str(params.adaptive_polling.error_rate)]
+        if params.adaptive_polling.max_interval is not None:
+            command_arguments += ["--max-interval", str(params.adaptive_polling.max_interval)]
+    if params.circuit_breaker is not None:
+        if params.circuit_breaker.threshold is not None:
+            command_arguments += ["--breaker-threshold", str(params.circuit_breaker.threshold)]
+        if params.circuit_breaker.auth_cooldown is not None:
+            command_arguments += ["--auth-cooldown", str(params.circuit_breaker.auth_cooldown)]
+        if params.circuit_breaker.network_cooldown is not None:
+            command_arguments += ["--network-cooldown", str(params.circuit_breaker.network_cooldown)]
+    if params.service_events is not None:
+        command_arguments += ["--service-events"]
+        if params.service_events.reconcile_interval is not None:
+            command_arguments += ["--reconcile-interval", str(params.service_events.reconcile_interval)]
+    if params.inventory is not None:
+        command_arguments += ["--inventory"]
+        if params.inventory.axl_version is not None:
+            command_arguments += ["--axl-version", params.inventory.axl_version]
+        if params.inventory.interval is not None:
+            command_arguments += ["--inventory-interval", str(params.inventory.interval)]
+    if params.cache_trust is not None and params.ssl[0] != "deactivated":
+        command_arguments += ["--cache-trust"]
+        if params.cache_trust.ca_file is not None:
+            command_arguments += ["--ca-file", params.cache_trust.ca_file]
+    if params.deadlines is not None:
+        if params.deadlines.services is not None:
+            command_arguments += ["--deadline", "services=%d" % params.deadlines.services]
+        if params.deadlines.inventory is not None:
+            command_arguments += ["--deadline", "inventory=%d" % params.deadlines.inventory]
     if params.ssl[0] == "deactivated":
         command_arguments += ["--no-cert-check"]
         host = host_config.name or primary_ip_config.address
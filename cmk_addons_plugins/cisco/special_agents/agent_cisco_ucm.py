@@ -9,11 +9,26 @@
 # https://developer.cisco.com/docs/sxml/#!control-center-services-api-reference
 
 import argparse
+import functools
+import hashlib
+import html
+import ipaddress
+import json
+import os
+import queue
 import re
 import socket
+import socketserver
+import ssl
 import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from xml.sax.saxutils import escape
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
 import urllib3  # type: ignore[import]
@@ -40,11 +55,33 @@ class SoapTemplates:
         '  <ns1:ServiceStatus></ns1:ServiceStatus>'
         '</ns1:soapGetServiceStatus>'
     )
+    EXECUTESQLQUERY = (
+        '<ns:executeSQLQuery>'
+        '  <sql>%(sql)s</sql>'
+        '</ns:executeSQLQuery>'
+    )
     # yapf: enable
 
     def __init__(self):
         super(SoapTemplates, self).__init__()
         self.getservicestatus = SoapTemplates.GETSERVICESTATUS
+        self.executesqlquery = SoapTemplates.EXECUTESQLQUERY
+
+
+# Phones (tkclass 1) paged in pkid order from the last pkid read, so that a crawl can resume
+AXL_VERSIONS_SQL = (
+    "SELECT FIRST %d d.pkid, d.versionstamp FROM device d"
+    " WHERE d.tkclass = 1 AND d.pkid > '%s' ORDER BY d.pkid"
+)
+AXL_DEVICES_SQL = (
+    "SELECT d.pkid, tm.name AS model, d.specialloadinformation AS fwload,"
+    " df.load AS defaultload, dp.name AS devicepool FROM device d"
+    " INNER JOIN typemodel tm ON tm.enum = d.tkmodel"
+    " LEFT OUTER JOIN devicepool dp ON dp.pkid = d.fkdevicepool"
+    " LEFT OUTER JOIN defaults df ON df.tkmodel = d.tkmodel"
+    " AND df.tkdeviceprotocol = d.tkdeviceprotocol"
+    " WHERE d.pkid IN (%s)"
+)
 
 
 # .
@@ -58,6 +95,27 @@ class SoapTemplates:
 #   '----------------------------------------------------------------------'
 
 
+def _deadline(value):
+    name, _sep, seconds = value.partition("=")
+    if name not in ("services", "inventory"):
+        raise argparse.ArgumentTypeError("unknown collector %r, expected services or inventory" %
+                                         name)
+    try:
+        seconds = int(seconds)
+    except ValueError:
+        seconds = 0
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError("expected COLLECTOR=SECS, got %r" % value)
+    return name, seconds
+
+
+def _network(value):
+    try:
+        return ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected an address or network, got %r" % value)
+
+
 def parse_arguments(argv):
     parser = argparse.ArgumentParser(description=__doc__)
 
@@ -68,6 +126,16 @@ def parse_arguments(argv):
         "--no-cert-check", action="store_true",
         help="""Disables the checking of the servers ssl certificate""")
 
+    parser.add_argument(
+        "--cache-trust", action="store_true",
+        help="""Verify the server certificate once against the CA bundle, pin it and build the
+        SSL context of later runs from the pinned certificate only. The host name is still
+        verified. The pin is renewed when the server certificate changes.""")
+    parser.add_argument(
+        "--ca-file",
+        default=None,
+        help="""CA file used to verify the server certificate instead of the default CA bundle
+        (with and without --cache-trust).""")
     parser.add_argument(
         "-t",
         "--timeout",
@@ -83,9 +151,99 @@ def parse_arguments(argv):
         help="""Alternative port number (default is 8443 for the https connection).""")
 
     # optional arguments (from a coding point of view - should some of them be mandatory?)
+    # adaptive polling
+    parser.add_argument(
+        "--adaptive-polling", action="store_true",
+        help="""Back off from polling a busy CUCM: when the response time or the error rate
+        of recent runs climbs, serve the cached service states instead of querying the server
+        until the effective polling interval has passed.""")
+    parser.add_argument(
+        "--backoff-latency",
+        type=float,
+        default=5.0,
+        help="""Average response time in seconds of recent runs above which the agent
+        backs off (default 5).""")
+    parser.add_argument(
+        "--backoff-error-rate",
+        type=float,
+        default=0.5,
+        help="""Share of failed queries among recent runs above which the agent
+        backs off (default 0.5).""")
+    parser.add_argument(
+        "--max-interval",
+        type=int,
+        default=600,
+        help="""Upper limit in seconds for the effective polling interval, i.e. the maximum
+        age of cached data served while backing off (default 600).""")
+
+    # circuit breaker
+    parser.add_argument(
+        "--breaker-threshold",
+        type=int,
+        default=3,
+        help="""Open the circuit breaker of the endpoint after this many consecutive failed
+        queries and fail fast until the cool-down has passed (default 3, 0 disables).""")
+    parser.add_argument(
+        "--auth-cooldown",
+        type=int,
+        default=3600,
+        help="""Seconds to wait before probing an endpoint again after authentication
+        errors, to avoid locking the account (default 3600).""")
+    parser.add_argument(
+        "--network-cooldown",
+        type=int,
+        default=300,
+        help="""Seconds to wait before probing an endpoint again after network or
+        server errors (default 300).""")
+
+    # service events
+    parser.add_argument(
+        "--service-events", action="store_true",
+        help="""Read service states from the table kept by the syslog listener
+        (cisco_ucm_syslog_listener) and query the server only for periodic reconciliation.""")
+    parser.add_argument(
+        "--reconcile-interval",
+        type=int,
+        default=3600,
+        help="""Seconds between full service status queries when --service-events
+        is used (default 3600).""")
+
     parser.add_argument("-u", "--user", default=None, help="""Username for login""")
     parser.add_argument("-s", "--secret", default=None, help="""Password for login""")
 
+    # AXL inventory
+    parser.add_argument(
+        "--inventory", action="store_true",
+        help="""Collect the HW/SW inventory of the phones (model, firmware load, device pool)
+        via AXL executeSQLQuery.""")
+    parser.add_argument(
+        "--axl-version",
+        default="12.5",
+        help="""AXL API version of the CUCM (default 12.5).""")
+    parser.add_argument(
+        "--inventory-interval",
+        type=int,
+        default=3600,
+        help="""Seconds between inventory collections, the cached inventory is reported
+        in between (default 3600).""")
+    parser.add_argument(
+        "--axl-chunk",
+        type=int,
+        default=1000,
+        help="""Initial number of rows per AXL SQL query. The chunk size is then adapted
+        to the response time and remembered between runs (default 1000).""")
+
+    # collectors
+    parser.add_argument(
+        "--deadline",
+        type=_deadline,
+        action="append",
+        default=[],
+        metavar="COLLECTOR=SECS",
+        help="""Deadline of a collector (services, inventory) within the agent run. A collector
+        exceeding its deadline only drops its own section. Defaults are twice the network
+        timeout for services and four times the network timeout for inventory.""")
+
     # positional arguments
     parser.add_argument("host_address",
                         metavar="HOST",
@@ -94,6 +252,39 @@ def parse_arguments(argv):
     return parser.parse_args(argv)
 
 
+def parse_listener_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description="""Check_MK Cisco UCM syslog listener: keeps the service states reported by
+        CUCM service alarms for the special agent (option --service-events)""")
+
+    parser.add_argument(
+        "--debug", action="store_true", help="""Debug mode: let Python exceptions come through""")
+    parser.add_argument(
+        "--no-tcp", action="store_true", help="""Listen on UDP only""")
+    parser.add_argument(
+        "-b",
+        "--bind",
+        default="0.0.0.0",
+        help="""Local address to listen on (default 0.0.0.0).""")
+    parser.add_argument(
+        "-p",
+        "--port",
+        type=int,
+        default=5514,
+        help="""Syslog port number to listen on (UDP and TCP, default 5514).""")
+    parser.add_argument(
+        "-a",
+        "--allow",
+        metavar="ADDRESS",
+        type=_network,
+        action="append",
+        required=True,
+        help="""Source address or network of the CUCM nodes (can be given multiple times).
+        Messages from any other sender are dropped.""")
+
+    return parser.parse_args(argv)
+
+
 #.
 #   .--Connection----------------------------------------------------------.
 #   |             ____                       _   _                         |
@@ -117,6 +308,220 @@ class CUCMUndecoded(RuntimeError):
     """ XXX Undecoded """
     pass
 
+class CUCMFault(RuntimeError):
+    """ SOAP Fault """
+    pass
+
+class CUCMCircuitOpen(RuntimeError):
+    """ Circuit breaker of the endpoint is open """
+    pass
+
+
+class CircuitBreaker:
+    """Fail fast on an endpoint which failed repeatedly
+
+    The number of consecutive failures is kept in the agent state. After
+    `threshold` failures the circuit opens and queries are refused without
+    contacting the server. When the cool-down of the last error kind has
+    passed, a single probe query is let through (half-open): success closes
+    the circuit, failure opens it again for another cool-down.
+    """
+
+    def __init__(self, state, threshold, auth_cooldown, network_cooldown):
+        super(CircuitBreaker, self).__init__()
+        self._state = state
+        self._state.setdefault("failures", 0)
+        self._state.setdefault("opened", None)
+        self._state.setdefault("kind", None)
+        self._state.setdefault("last_error", None)
+        self._threshold = threshold
+        self._cooldowns = {"auth": auth_cooldown, "network": network_cooldown}
+
+    def call(self, func, now=None):
+        now = time.time() if now is None else now
+        if self._threshold and self._state["opened"] is not None:
+            remaining = self._state["opened"] + self._cooldowns[self._state["kind"]] - now
+            if remaining > 0:
+                raise CUCMCircuitOpen(
+                    "Circuit breaker open after %d consecutive %s errors (last: %s), "
+                    "next probe in %ds" % (self._state["failures"], self._state["kind"],
+                                           self._state["last_error"], remaining))
+
+        try:
+            result = func()
+        except (CUCMUnauthorized, CUCMForbidden) as exc:
+            self.failure("auth", exc, now)
+            raise
+        except (CUCMUndecoded, requests.exceptions.RequestException, OSError) as exc:
+            self.failure("network", exc, now)
+            raise
+
+        self._state.update(failures=0, opened=None, kind=None, last_error=None)
+        return result
+
+    def failure(self, kind, exc, now):
+        self._state["failures"] += 1
+        self._state["kind"] = kind
+        self._state["last_error"] = str(exc)
+        if self._threshold and self._state["failures"] >= self._threshold:
+            self._state["opened"] = now
+
+
+@functools.lru_cache
+def _credentials_digest(user, secret, salt):
+    return hashlib.pbkdf2_hmac("sha256", ("%s\0%s" % (user, secret)).encode(),
+                               bytes.fromhex(salt), 100000).hex()
+
+
+def endpoint_breaker(opt, state, suffix=""):
+    """Circuit breaker of the endpoint for the configured credentials
+
+    A salted PBKDF2 digest of user and secret is kept with the breakers, so
+    changing the credentials in the rule drops the state of the old ones
+    (e.g. an open auth breaker).
+    """
+    breaker = state.setdefault("breaker", {})
+    salt = breaker.get("salt")
+    if salt is None or breaker.get("credentials") != _credentials_digest(opt.user, opt.secret, salt):
+        salt = os.urandom(16).hex()
+        breaker.clear()
+        breaker.update(salt=salt, credentials=_credentials_digest(opt.user, opt.secret, salt),
+                       endpoints={})
+    endpoint = "%s:%s%s" % (opt.host_address, opt.port, suffix)
+    return CircuitBreaker(breaker["endpoints"].setdefault(endpoint, {}), opt.breaker_threshold,
+                          opt.auth_cooldown, opt.network_cooldown)
+
+
+class TimedSSLContext(ssl.SSLContext):
+    """SSL context recording the duration of its TLS handshakes"""
+
+    def wrap_socket(self, *args, **kwargs):
+        start = time.monotonic()
+        sock = super(TimedSSLContext, self).wrap_socket(*args, **kwargs)
+        self.handshakes.append(time.monotonic() - start)
+        return sock
+
+
+class TrustCache:
+    """Pinned server certificate of an endpoint
+
+    The certificate is verified once with a full handshake against the CA
+    bundle and stored in the state directory. The bundle is looked up like
+    requests does: --ca-file, REQUESTS_CA_BUNDLE, CURL_CA_BUNDLE, certifi.
+    Later runs build a single SSL context trusting only the pinned
+    certificate, which avoids loading the whole bundle. Host name
+    verification stays enabled. The path and modification time of the
+    bundle are kept with the pin, so the certificate is verified and pinned
+    again when the bundle is changed or replaced (e.g. a revoked CA).
+    """
+
+    def __init__(self, address, port, state, ca_file=None):
+        super(TrustCache, self).__init__()
+        self._address = address
+        self._port = port
+        self._state = state
+        self._ca_file = ca_file
+        self.path = state_dir() / ("%s_%s.pem" % (address, port))
+        self._context = None
+        self._mode = "pinned"
+        self._setup_time = 0.0
+        self._lock = threading.RLock()
+        self._state_lock = threading.Lock()
+
+    def snapshot(self):
+        """Copy of the state for saving; collector threads may still pin meanwhile"""
+        with self._state_lock:
+            return dict(self._state)
+
+    def context(self):
+        with self._lock:
+            if self._context is None:
+                if not self.path.exists() or self.snapshot().get("ca") != self._ca_source():
+                    self._pin()
+                start = time.monotonic()
+                context = TimedSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+                context.handshakes = []
+                context.verify_flags |= ssl.VERIFY_X509_PARTIAL_CHAIN
+                context.load_verify_locations(cafile=str(self.path))
+                self._setup_time += time.monotonic() - start
+                self._context = context
+            return self._context
+
+    def pin(self):
+        with self._lock:
+            self._pin()
+
+    def _ca_bundle(self):
+        return (self._ca_file or os.environ.get("REQUESTS_CA_BUNDLE") or
+                os.environ.get("CURL_CA_BUNDLE") or requests.certs.where())
+
+    def _ca_source(self):
+        ca_bundle = self._ca_bundle()
+        try:
+            return [ca_bundle, os.stat(ca_bundle).st_mtime]
+        except OSError:
+            return [ca_bundle, None]
+
+    def _pin(self):
+        ca_source = self._ca_source()
+        ca_bundle = ca_source[0]
+        start = time.monotonic()
+        if os.path.isdir(ca_bundle):
+            context = ssl.create_default_context(capath=ca_bundle)
+        else:
+            context = ssl.create_default_context(cafile=ca_bundle)
+        setup_time = time.monotonic() - start
+        with socket.create_connection((self._address, self._port)) as sock:
+            start = time.monotonic()
+            with context.wrap_socket(sock, server_hostname=self._address) as tls_sock:
+                handshake_time = time.monotonic() - start
+                certificate = tls_sock.getpeercert(binary_form=True)
+        with self._state_lock:
+            self._state.update(ca=ca_source, bundle_setup=setup_time,
+                               bundle_handshake=handshake_time)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(ssl.DER_cert_to_PEM_cert(certificate))
+        os.replace(tmp_path, self.path)
+        self._context = None
+        self._mode = "pinned new"
+
+    def section(self):
+        """Context setup and first handshake of this run against those with the CA bundle"""
+        state = self.snapshot()
+        bundle_setup = state.get("bundle_setup", 0.0)
+        bundle_handshake = state.get("bundle_handshake", 0.0)
+        lines = [
+            "tls|trust|%s" % self._mode,
+            "tls|setup_ms|%.1f" % (self._setup_time * 1000),
+            "tls|bundle_setup_ms|%.1f" % (bundle_setup * 1000),
+            "tls|bundle_handshake_ms|%.1f" % (bundle_handshake * 1000),
+        ]
+        handshakes = self._context.handshakes if self._context is not None else []
+        if handshakes:
+            lines += [
+                "tls|handshake_ms|%.1f" % (handshakes[0] * 1000),
+                "tls|handshakes|%d" % len(handshakes),
+            ]
+        if handshakes and self._mode == "pinned":
+            # a run which pinned has paid for the bundle handshake as well, nothing saved
+            lines.append("tls|saved_ms|%.1f" % ((bundle_setup + bundle_handshake -
+                                                 self._setup_time - handshakes[0]) * 1000))
+        return lines
+
+
+class TrustCacheAdapter(HTTPAdapter):
+    """Use the SSL context of the trust cache for all connections"""
+
+    def __init__(self, trust, **kwargs):
+        self._trust = trust
+        super(TrustCacheAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        # set up lazily, pinning may need a handshake with the server
+        self.poolmanager.connection_pool_kw["ssl_context"] = self._trust.context()
+        return super(TrustCacheAdapter, self).send(request, **kwargs)
+
 
 class CUCMSession(requests.Session):
     """Encapsulates the Sessions with the CUC system"""
@@ -128,39 +533,95 @@ class CUCMSession(requests.Session):
                 '<SOAP-ENV:Body xmlns:ns1="http://schemas.cisco.com/ast/soap">%s</SOAP-ENV:Body>'
                 '</SOAP-ENV:Envelope>')
 
-    def __init__(self, address, port, no_cert_check=False, user=None, secret=None):
+    PATH = "/controlcenterservice2/services/ControlCenterServices?wsdl"
+    SOAPACTION = "urn:vim25/5.0"
+
+    def __init__(self, address, port, no_cert_check=False, user=None, secret=None, trust=None,
+                 adapter=None, ca_file=None):
         super(CUCMSession, self).__init__()
+        self._trust = None
         if no_cert_check:
             # Watch out: we must provide the verify keyword to every individual request call!
             # Else it will be overwritten by the REQUESTS_CA_BUNDLE env variable
             self.verify = False
             urllib3.disable_warnings(category=urllib3.exceptions.InsecureRequestWarning)
+        elif trust is not None:
+            # requests passes the verify path on to urllib3, which loads it into our context,
+            # so point it to the pinned certificate instead of the default bundle
+            self._trust = trust
+            self.verify = str(trust.path)
+            if adapter is None:
+                adapter = TrustCacheAdapter(trust)
+        elif ca_file is not None:
+            self.verify = ca_file
+        if adapter is not None:
+            self.mount("https://", adapter)
 
-        self._post_url = "https://%s:%s/controlcenterservice2/services/ControlCenterServices?wsdl" % (address, port)
+        self._post_url = "https://%s:%s%s" % (address, port, self.PATH)
         self.headers.update({
             "Content-Type": 'text/xml; charset="utf-8"',
-            "SOAPAction": "urn:vim25/5.0",
+            "SOAPAction": self.SOAPACTION,
             "User-Agent": "Checkmk special agent Cisco UCM",
         })
         if user is not None and secret is not None:
             self.auth = HTTPBasicAuth(user, secret)
 
     def postsoap(self, request):
-        soapdata = CUCMSession.ENVELOPE % request
-        # Watch out: we must provide the verify keyword to every individual request call!
-        # Else it will be overwritten by the REQUESTS_CA_BUNDLE env variable
+        return self.post_pinned(self.ENVELOPE % request)
+
+    def post_pinned(self, soapdata):
+        try:
+            # Watch out: we must provide the verify keyword to every individual request call!
+            # Else it will be overwritten by the REQUESTS_CA_BUNDLE env variable
+            return super(CUCMSession, self).post(self._post_url, data=soapdata, verify=self.verify)
+        except requests.exceptions.SSLError:
+            if self._trust is None:
+                raise
+        # the server certificate changed: verify it against the CA bundle and pin it again
+        self._trust.pin()
         return super(CUCMSession, self).post(self._post_url, data=soapdata, verify=self.verify)
 
 
+class AXLSession(CUCMSession):
+    """Encapsulates the Sessions with the AXL API of the CUC system"""
+    ENVELOPE = ('<soapenv:Envelope'
+                ' xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/"'
+                ' xmlns:ns="http://www.cisco.com/AXL/API/%(version)s">'
+                '<soapenv:Header/>'
+                '<soapenv:Body>%(request)s</soapenv:Body>'
+                '</soapenv:Envelope>')
+    PATH = "/axl/"
+
+    def __init__(self, address, port, version, no_cert_check=False, user=None, secret=None,
+                 trust=None, adapter=None, ca_file=None):
+        super(AXLSession, self).__init__(address, port, no_cert_check, user, secret, trust, adapter,
+                                         ca_file)
+        self._version = version
+        self.headers["SOAPAction"] = '"CUCM:DB ver=%s"' % version
+
+    def postsoap(self, request):
+        return self.post_pinned(self.ENVELOPE % {"version": self._version, "request": request})
+
+
 class CUCMConnection:
 
-    def __init__(self, address, port, opt):
+    def __init__(self, address, port, opt, breaker=None, trust=None, adapter=None):
         super(CUCMConnection, self).__init__()
 
-        self._session = CUCMSession(address, port, opt.no_cert_check, opt.user, opt.secret)
+        self._session = self._make_session(address, port, opt, trust, adapter)
         self._soap_templates = SoapTemplates()
+        self._breaker = breaker
+
+    def _make_session(self, address, port, opt, trust, adapter):
+        return CUCMSession(address, port, opt.no_cert_check, opt.user, opt.secret, trust, adapter,
+                           opt.ca_file)
 
     def query_server(self, method, **kwargs):
+        if self._breaker is None:
+            return self._query_server(method, **kwargs)
+        return self._breaker.call(lambda: self._query_server(method, **kwargs))
+
+    def _query_server(self, method, **kwargs):
         payload = getattr(self._soap_templates, method) % kwargs
         response = self._session.postsoap(payload)
         if response.status_code == 200:
@@ -169,9 +630,489 @@ class CUCMConnection:
             raise CUCMUnauthorized("401 Unauthorized")
         if response.status_code == 403:
             raise CUCMForbidden("403 Forbidden")
+        fault = get_pattern('<faultstring>(.*?)</faultstring>', response.text)
+        if response.status_code == 500 and fault:
+            raise CUCMFault(html.unescape(fault[0]))
         raise CUCMUndecoded(f"{response.status_code} Undecoded status code")
 
 
+class AXLConnection(CUCMConnection):
+
+    def _make_session(self, address, port, opt, trust, adapter):
+        return AXLSession(address, port, opt.axl_version, opt.no_cert_check, opt.user, opt.secret,
+                          trust, adapter, opt.ca_file)
+
+    def query_sql(self, sql):
+        return parse_sql_rows(self.query_server('executesqlquery', sql=escape(sql)))
+
+
+#.
+#   .--State---------------------------------------------------------------.
+#   |                      ____  _        _                                |
+#   |                     / ___|| |_ __ _| |_ ___                          |
+#   |                     \___ \| __/ _` | __/ _ \                         |
+#   |                      ___) | || (_| | ||  __/                         |
+#   |                     |____/ \__\__,_|\__\___|                         |
+#   |                                                                      |
+#   '----------------------------------------------------------------------'
+
+
+def state_dir():
+    return Path(cmk.utils.paths.tmp_dir) / "agents" / "agent_cisco_ucm"
+
+
+def _load_json(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(data))
+    os.replace(tmp_path, path)
+
+
+class AgentState(dict):
+    """Persistent state of the agent, kept per host between runs"""
+
+    def __init__(self, host_address):
+        super(AgentState, self).__init__()
+        self._path = state_dir() / ("%s.json" % host_address)
+        self.update(_load_json(self._path))
+
+    def save(self):
+        _save_json(self._path, self)
+
+
+class AdaptivePolling:
+    """Stretch the polling interval while the server is slow or failing
+
+    The response time and the outcome of the last HISTORY queries are kept in
+    the agent state. While the average response time or the error rate is above
+    the configured limits, the effective interval is doubled (starting with
+    STEP seconds, up to --max-interval) and cached data is served within it.
+    Once the server recovers the interval is halved down to zero again, which
+    means polling on every run.
+
+    `last_poll` (any attempt) paces the queries, `cached_at` (last successful
+    query) is the age of the cached data, which is never served when older
+    than --max-interval.
+    """
+    HISTORY = 5
+    STEP = 60
+
+    def __init__(self, state, opt):
+        super(AdaptivePolling, self).__init__()
+        self._state = state
+        self._state.setdefault("history", [])
+        self._state.setdefault("interval", 0)
+        self._state.setdefault("last_poll", 0)
+        self._state.setdefault("cached_at", 0)
+        self._state.setdefault("cache", None)
+        self._latency_limit = opt.backoff_latency
+        self._error_rate_limit = opt.backoff_error_rate
+        self._max_interval = opt.max_interval
+        self._mode = "polled"
+        self._reason = "ok"
+
+    @property
+    def polled_at(self):
+        """Time of the last successful query, i.e. of the data returned by fetch"""
+        return self._state["cached_at"]
+
+    @property
+    def max_interval(self):
+        return self._max_interval
+
+    @property
+    def cached(self):
+        return self._mode == "cached"
+
+    def fetch(self, query, now=None):
+        now = time.time() if now is None else now
+        cache = self._state["cache"]
+        since_poll = now - self._state["last_poll"]
+        if (cache is not None and since_poll < self._state["interval"] and
+                now - self._state["cached_at"] <= self._max_interval):
+            self._mode = "cached"
+            self._reason = "backing off for %ds" % (self._state["interval"] - since_poll)
+            return cache
+
+        start = time.monotonic()
+        try:
+            data = query()
+        except CUCMCircuitOpen:
+            # refused without asking the server, says nothing about its load
+            raise
+        except Exception:
+            self._record(time.monotonic() - start, False, now)
+            raise
+        self._record(time.monotonic() - start, True, now)
+        self._state["cache"] = data
+        self._state["cached_at"] = now
+        return data
+
+    def record_failure(self, elapsed, now):
+        self._record(elapsed, False, now)
+
+    def _record(self, elapsed, success, now):
+        history = self._state["history"]
+        history.append([round(elapsed, 3), success])
+        del history[:-self.HISTORY]
+        self._state["last_poll"] = now
+
+        latency = self.latency()
+        error_rate = self.error_rate()
+        interval = self._state["interval"]
+        if latency > self._latency_limit:
+            self._reason = "latency %.2fs above %.2fs" % (latency, self._latency_limit)
+            interval = min(max(interval * 2, self.STEP), self._max_interval)
+        elif error_rate > self._error_rate_limit:
+            self._reason = "error rate %.2f above %.2f" % (error_rate, self._error_rate_limit)
+            interval = min(max(interval * 2, self.STEP), self._max_interval)
+        else:
+            self._reason = "ok"
+            interval = interval // 2 if interval > self.STEP else 0
+        self._state["interval"] = interval
+
+    def latency(self):
+        samples = [elapsed for elapsed, success in self._state["history"] if success]
+        return sum(samples) / len(samples) if samples else 0.0
+
+    def error_rate(self):
+        history = self._state["history"]
+        return sum(1 for _elapsed, success in history if not success) / len(history) if history else 0.0
+
+    def section(self, now=None):
+        now = time.time() if now is None else now
+        return [
+            "polling|mode|%s" % self._mode,
+            "polling|interval|%d" % self._state["interval"],
+            "polling|cache_age|%d" % (now - self._state["cached_at"]),
+            "polling|latency|%.3f" % self.latency(),
+            "polling|error_rate|%.2f" % self.error_rate(),
+            "polling|reason|%s" % self._reason,
+        ]
+
+
+#.
+#   .--Syslog--------------------------------------------------------------.
+#   |                    ____            _                                 |
+#   |                   / ___| _   _ ___| | ___   __ _                     |
+#   |                   \___ \| | | / __| |/ _ \ / _` |                    |
+#   |                    ___) | |_| \__ \ | (_) | (_| |                    |
+#   |                   |____/ \__, |___/_|\___/ \__, |                    |
+#   |                          |___/             |___/                     |
+#   '----------------------------------------------------------------------'
+
+# e.g. %UC_GENERIC-3-ServiceStopped: %[ServiceName=Cisco Tftp][ClusterID=...][NodeID=cucm1]: ...
+SERVICE_ALARM = re.compile(r"%[A-Z0-9_]+-\d-(ServiceStarted|ServiceStopped|ServiceStartFailed)\b(.*)")
+ALARM_PARAMETER = re.compile(r"\[(\w+)=([^\]]*)\]")
+# status, reason code and reason as in soapGetServiceStatus, a positive code shows the reason
+ALARM_STATES = {
+    "ServiceStarted": ("Started", "-1", ""),
+    "ServiceStopped": ("Stopped", "-1", ""),
+    "ServiceStartFailed": ("Stopped", "1", "Service start failed"),
+}
+
+
+def parse_service_alarm(message):
+    match = SERVICE_ALARM.search(message)
+    if not match:
+        return None
+    parameters = dict(ALARM_PARAMETER.findall(match.group(2)))
+    if "ServiceName" not in parameters:
+        return None
+    return (parameters.get("NodeID", ""), parameters["ServiceName"]) + ALARM_STATES[match.group(1)]
+
+
+class ServiceEventTable:
+    """Per node service states reported by CUCM service alarms
+
+    The table is written by the syslog listener and read by the agent:
+    {"heartbeat": ..., "pid": ...,
+     "nodes": {node: {"address": ..., "services": {service: [status, code, reason, timestamp]}}}}
+    The listener refreshes the heartbeat every HEARTBEAT seconds; a table
+    without a recent heartbeat is not used.
+    """
+    HEARTBEAT = 60
+
+    def __init__(self, path=None):
+        super(ServiceEventTable, self).__init__()
+        self._path = state_dir() / "service_events.json" if path is None else path
+
+    def load(self):
+        return _load_json(self._path)
+
+    def save(self, table):
+        _save_json(self._path, table)
+
+    def lookup(self, host_address, now=None):
+        """Service events of the node, None if the listener is not running"""
+        now = time.time() if now is None else now
+        table = self.load()
+        if now - table.get("heartbeat", 0) > 3 * self.HEARTBEAT:
+            return None
+        candidates = {host_address.lower(), host_address.split(".")[0].lower()}
+        try:
+            candidates.add(socket.gethostbyname(host_address))
+        except OSError:
+            pass
+        for node, entry in table.get("nodes", {}).items():
+            if node in candidates or entry.get("address") in candidates:
+                return entry["services"]
+        return {}
+
+
+def apply_service_events(servicestatus, events, since):
+    services = {entry[0]: list(entry) for entry in servicestatus}
+    for name, (status, reason_code, reason, timestamp) in events.items():
+        if timestamp > since:
+            services[name] = [name, status, reason_code, reason]
+    return list(services.values())
+
+
+class ServiceEventListener:
+    """Keep the service event table up to date from received syslog messages
+
+    Syslog is unauthenticated, so only messages from the allowed source networks
+    (the CUCM nodes) are accepted.
+    """
+
+    def __init__(self, table, allowed):
+        super(ServiceEventListener, self).__init__()
+        self._table = table
+        self._allowed = allowed
+        self._nodes = table.load().get("nodes", {})
+        self._lock = threading.Lock()
+
+    def heartbeat(self, now=None):
+        with self._lock:
+            self._save(time.time() if now is None else now)
+
+    def allowed(self, address):
+        try:
+            address = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        address = getattr(address, "ipv4_mapped", None) or address
+        return any(address in network for network in self._allowed)
+
+    def handle(self, message, address, now=None):
+        if not self.allowed(address):
+            return
+        alarm = parse_service_alarm(message)
+        if alarm is None:
+            return
+        node, service, status, reason_code, reason = alarm
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._nodes.setdefault((node or address).lower(), {"services": {}})
+            entry["address"] = address
+            entry["services"][service] = [status, reason_code, reason, now]
+            self._save(now)
+
+    def _save(self, now):
+        self._table.save({"heartbeat": now, "pid": os.getpid(), "nodes": self._nodes})
+
+
+class SyslogUDPHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        self.server.listener.handle(self.request[0].decode("utf-8", "replace"),
+                                    self.client_address[0])
+
+
+class SyslogTCPHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            self.server.listener.handle(line.decode("utf-8", "replace"), self.client_address[0])
+
+
+class SyslogUDPServer(socketserver.ThreadingUDPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, listener):
+        super(SyslogUDPServer, self).__init__(address, SyslogUDPHandler)
+        self.listener = listener
+
+    def verify_request(self, request, client_address):
+        return self.listener.allowed(client_address[0])
+
+
+class SyslogTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, listener):
+        super(SyslogTCPServer, self).__init__(address, SyslogTCPHandler)
+        self.listener = listener
+
+    def verify_request(self, request, client_address):
+        return self.listener.allowed(client_address[0])
+
+
+#.
+#   .--Inventory-----------------------------------------------------------.
+#   |            ___                      _                                |
+#   |           |_ _|_ ____   _____ _ __ | |_ ___  _ __ _   _              |
+#   |            | || '_ \ \ / / _ \ '_ \| __/ _ \| '__| | | |             |
+#   |            | || | | \ V /  __/ | | | || (_) | |  | |_| |             |
+#   |           |___|_| |_|\_/ \___|_| |_|\__\___/|_|   \__, |             |
+#   |                                                  |___/               |
+#   '----------------------------------------------------------------------'
+
+
+class AXLInventory:
+    """Collect the phone inventory with chunked AXL SQL queries
+
+    The pkid and versionstamp of all phones are paged in pkid order from the
+    cursor of the crawl, then details are queried only for devices which are
+    new or whose versionstamp changed since the last run. After every page the
+    crawl (cursor and versions read so far) and the devices are handed to
+    `checkpoint`, so an interrupted crawl resumes where it stopped.
+
+    The chunk size is doubled while queries return within half of TARGET
+    seconds and halved when they take longer than TARGET or AXL refuses the
+    query as too large; in the latter case the chunk size is not raised again
+    during the run.
+    """
+    MIN_CHUNK = 100
+    MAX_CHUNK = 5000
+    MAX_IN_LIST = 500
+    TARGET = 2.0
+    RETRY = 60
+
+    def __init__(self, axl, devices, chunk, crawl=None, checkpoint=None):
+        super(AXLInventory, self).__init__()
+        self._axl = axl
+        self._devices = devices
+        self._crawl = {} if crawl is None else crawl
+        self._crawl.setdefault("after", "")
+        self._crawl.setdefault("versions", {})
+        self._crawl.setdefault("changed", 0)
+        self._checkpoint = checkpoint or (lambda: None)
+        self.chunk = min(max(chunk, self.MIN_CHUNK), self.MAX_CHUNK)
+        self._max_chunk = self.MAX_CHUNK
+
+    def collect(self):
+        versions = self._crawl["versions"]
+        self._versions()
+        for pkid in set(self._devices) - set(versions):
+            del self._devices[pkid]
+        self._details(sorted(
+            pkid for pkid, version in versions.items()
+            if pkid not in self._devices or self._devices[pkid][0] != version))
+        return self._crawl["changed"]
+
+    def _versions(self):
+        crawl = self._crawl
+        while crawl["after"] is not None:
+            chunk = self.chunk
+            rows = self._query(AXL_VERSIONS_SQL % (chunk, crawl["after"]))
+            if rows is None:
+                continue
+            crawl["versions"].update((row["pkid"], row.get("versionstamp", "")) for row in rows)
+            crawl["after"] = rows[-1]["pkid"] if len(rows) == chunk else None
+            self._checkpoint()
+
+    def _details(self, pkids):
+        versions = self._crawl["versions"]
+        while pkids:
+            count = min(self.chunk, self.MAX_IN_LIST)
+            rows = self._query(AXL_DEVICES_SQL % ",".join("'%s'" % pkid for pkid in pkids[:count]))
+            if rows is None:
+                continue
+            for row in rows:
+                self._devices[row["pkid"]] = [
+                    versions.get(row["pkid"], ""),
+                    row.get("model", ""),
+                    row.get("fwload") or row.get("defaultload", ""),
+                    row.get("devicepool", ""),
+                ]
+            # no details (e.g. unknown model): remember the version, don't query again until it changes
+            for pkid in pkids[:count]:
+                if pkid not in self._devices or self._devices[pkid][0] != versions[pkid]:
+                    self._devices[pkid] = [versions[pkid], "", "", ""]
+            self._crawl["changed"] += len(pkids[:count])
+            self._checkpoint()
+            pkids = pkids[count:]
+
+    def _query(self, sql):
+        start = time.monotonic()
+        try:
+            rows = self._axl.query_sql(sql)
+        except CUCMFault as exc:
+            if "too large" not in str(exc).lower() or self.chunk <= self.MIN_CHUNK:
+                raise
+            self.chunk = self._max_chunk = max(self.chunk // 2, self.MIN_CHUNK)
+            return None
+        elapsed = time.monotonic() - start
+        if elapsed < self.TARGET / 2:
+            self.chunk = min(self.chunk * 2, self._max_chunk)
+        elif elapsed > self.TARGET:
+            self.chunk = max(self.chunk // 2, self.MIN_CHUNK)
+        return rows
+
+
+def fetch_inventory(axl, opt, now):
+    """Inventory section of the phones, crawled at most every --inventory-interval
+
+    Every attempt is recorded before the crawl starts, so a crawl which fails
+    or is abandoned at its deadline is resumed only after a back-off (RETRY
+    seconds, doubled with every attempt, at most the inventory interval).
+    """
+    path = state_dir() / ("%s.inventory.json" % opt.host_address)
+    cache = _load_json(path)
+    cache.setdefault("devices", {})
+    cache.setdefault("chunk", opt.axl_chunk)
+    cache.setdefault("last_run", 0)
+    cache.setdefault("attempts", 0)
+    cache.setdefault("last_attempt", 0)
+
+    if "crawl" in cache:
+        backoff = min(AXLInventory.RETRY * 2**(cache["attempts"] - 1), opt.inventory_interval)
+        due = now - cache["last_attempt"] >= backoff
+    else:
+        due = now - cache["last_run"] >= opt.inventory_interval
+
+    agent_section = []
+    if due:
+        crawl = cache.setdefault("crawl", {})
+        cache.update(attempts=cache["attempts"] + 1, last_attempt=now)
+        _save_json(path, cache)
+
+        def checkpoint():
+            cache["chunk"] = inventory.chunk
+            _save_json(path, cache)
+
+        inventory = AXLInventory(axl, cache["devices"], cache["chunk"], crawl, checkpoint)
+        changed = inventory.collect()
+        del cache["crawl"]
+        cache.update(chunk=inventory.chunk, last_run=now, attempts=0)
+        _save_json(path, cache)
+        agent_section.append("inventory|changed|%d" % changed)
+        agent_section.append("inventory|chunk|%d" % inventory.chunk)
+    elif "crawl" in cache:
+        agent_section.append("inventory|attempts|%d" % cache["attempts"])
+    unresolved = sum(1 for _version, model, _firmware, _devicepool in cache["devices"].values()
+                     if not model)
+    agent_section.append("inventory|devices|%d" % len(cache["devices"]))
+    agent_section.append("inventory|unresolved|%d" % unresolved)
+    agent_section.append("inventory|age|%d" % (now - cache["last_run"]))
+
+    counts = Counter((model, firmware, devicepool)
+                     for _version, model, firmware, devicepool in cache["devices"].values()
+                     if model)
+    section = ["%s|%s|%s|%d" % (key + (count,)) for key, count in sorted(counts.items())]
+    return section, agent_section
+
+
 #.
 #   .--unsorted------------------------------------------------------------.
 #   |                                       _           _                  |
@@ -186,6 +1127,15 @@ class CUCMConnection:
 def get_pattern(pattern, line):
     return re.findall(pattern, line, re.DOTALL) if line else []
 
+def parse_sql_rows(response):
+    rows = []
+    for row in get_pattern('<row>(.*?)</row>', response):
+        columns = {}
+        for name, value, empty_name in get_pattern(r'<(\w+)>([^<]*)</\1>|<(\w+)\s*/>', row):
+            columns[name or empty_name] = html.unescape(value)
+        rows.append(columns)
+    return rows
+
 def fetch_servicestatus(con):
     response = con.query_server('getservicestatus')
     items = get_pattern(
@@ -197,12 +1147,163 @@ def fetch_servicestatus(con):
     return items
 
 
-def fetch_data(con, opt):
+def collect_services(opt, adapter, trust, state):
+    con = CUCMConnection(opt.host_address, opt.port, opt, endpoint_breaker(opt, state), trust,
+                         adapter)
     output = []
-    servicestatus = fetch_servicestatus(con)
-    output.append("<<<cisco_ucm_services:sep(124)>>>")
+    agent_section = []
+    header = "<<<cisco_ucm_services:sep(124)>>>"
+    polling = AdaptivePolling(state.setdefault("polling", {}), opt) if opt.adaptive_polling else None
+    reconcile = state.setdefault("reconcile", {}) if opt.service_events else None
+    now = time.time()
+
+    events = ServiceEventTable().lookup(opt.host_address, now) if reconcile is not None else None
+
+    if events is not None and reconcile and now - reconcile["last_poll"] < opt.reconcile_interval:
+        servicestatus = apply_service_events(reconcile["services"], events, reconcile["last_poll"])
+        agent_section.append("events|source|syslog")
+        agent_section.append("events|reconcile_age|%d" % (now - reconcile["last_poll"]))
+    else:
+        if polling is None:
+            servicestatus = fetch_servicestatus(con)
+            polled_at = now
+        else:
+            servicestatus = polling.fetch(lambda: fetch_servicestatus(con), now)
+            polled_at = polling.polled_at
+            agent_section += polling.section(now)
+            if polling.cached:
+                # let Checkmk know the age of the data, so it can tell when it is outdated
+                header = "<<<cisco_ucm_services:sep(124):cached(%d,%d)>>>" % (
+                    polled_at, polling.max_interval)
+        if reconcile is not None:
+            reconcile.update(services=servicestatus, last_poll=polled_at)
+            agent_section.append("events|source|soap")
+        if events is not None:
+            servicestatus = apply_service_events(servicestatus, events, polled_at)
+        elif reconcile is not None:
+            agent_section.append("events|listener|not running")
+
+    output.append(header)
     output += ["|".join(entry) for entry in servicestatus]
-    return output
+    return output, agent_section
+
+
+def services_timeout(opt, state, deadline, now):
+    endpoint_breaker(opt, state).failure("network", "deadline of %ds exceeded" % deadline, now)
+    if opt.adaptive_polling:
+        AdaptivePolling(state.setdefault("polling", {}), opt).record_failure(deadline, now)
+
+
+def collect_inventory(opt, adapter, trust, state):
+    axl = AXLConnection(opt.host_address, opt.port, opt, endpoint_breaker(opt, state, "/axl"),
+                        trust, adapter)
+    inventory, agent_section = fetch_inventory(axl, opt, time.time())
+    return ["<<<cisco_ucm_inventory:sep(124)>>>"] + inventory, agent_section
+
+
+def inventory_timeout(opt, state, deadline, now):
+    endpoint_breaker(opt, state, "/axl").failure("network",
+                                                 "deadline of %ds exceeded" % deadline, now)
+
+
+class Collector:
+    """One independent API collection of an agent run
+
+    The collector runs in its own (daemon) thread on a private copy of its
+    part of the agent state, which is taken over by fetch_data once the
+    collector has finished. When the collector is abandoned after its
+    deadline, its copy is discarded and `timeout` records the failure in the
+    agent state instead (e.g. for the circuit breaker).
+    """
+
+    def __init__(self, name, deadline, collect, timeout):
+        super(Collector, self).__init__()
+        self.name = name
+        self.deadline = deadline
+        self.state = {}
+        self.started = 0.0
+        self._collect = collect
+        self._timeout = timeout
+
+    def timed_out(self, state, now=None):
+        self._timeout(state.setdefault(self.name, {}), self.deadline,
+                      time.time() if now is None else now)
+
+    def start(self, state, results):
+        self.state = json.loads(json.dumps(state.get(self.name, {})))
+        self.started = time.monotonic()
+        threading.Thread(target=self._run, args=(results,), daemon=True).start()
+
+    def _run(self, results):
+        try:
+            results.put((self, self._collect(self.state), None))
+        except Exception as exc:
+            results.put((self, None, exc))
+
+
+def make_collectors(opt, adapter, trust):
+    deadlines = dict(opt.deadline)
+    collectors = [
+        Collector("services", deadlines.get("services", 2 * opt.timeout),
+                  functools.partial(collect_services, opt, adapter, trust),
+                  functools.partial(services_timeout, opt)),
+    ]
+    if opt.inventory:
+        collectors.append(
+            Collector("inventory", deadlines.get("inventory", 4 * opt.timeout),
+                      functools.partial(collect_inventory, opt, adapter, trust),
+                      functools.partial(inventory_timeout, opt)))
+    return collectors
+
+
+def fetch_data(collectors, opt, state, trust=None):
+    """Run the collectors concurrently and write each section as soon as it is ready
+
+    A failing collector or one exceeding its deadline only drops its own
+    section. Returns the errors by collector name.
+    """
+    results = queue.Queue()
+    for collector in collectors:
+        collector.start(state, results)
+
+    errors = {}
+    agent_section = []
+    pending = set(collectors)
+    while pending:
+        timeout = min(collector.started + collector.deadline for collector in pending) - time.monotonic()
+        try:
+            collector, result, exc = results.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            for collector in [c for c in pending if c.started + c.deadline <= time.monotonic()]:
+                pending.discard(collector)
+                collector.timed_out(state)
+                errors[collector.name] = "deadline of %ds exceeded" % collector.deadline
+                agent_section.append("collector|%s|timeout|%d" % (collector.name, collector.deadline))
+            continue
+        if collector not in pending:
+            continue
+        pending.discard(collector)
+        # keep the state of failed collectors too, e.g. the circuit breaker counts
+        state[collector.name] = collector.state
+        elapsed = time.monotonic() - collector.started
+        if exc is not None:
+            if opt.debug:
+                raise exc
+            errors[collector.name] = str(exc)
+            agent_section.append("collector|%s|failed|%s" % (collector.name, " ".join(
+                str(exc).replace("|", " ").split())))
+            continue
+        output, collector_agent_section = result
+        sys.stdout.writelines("%s\n" % line for line in output)
+        sys.stdout.flush()
+        agent_section.append("collector|%s|ok|%.3f" % (collector.name, elapsed))
+        agent_section += collector_agent_section
+
+    if trust is not None:
+        agent_section += trust.section()
+    sys.stdout.write("<<<cisco_ucm_agent:sep(124)>>>\n")
+    sys.stdout.writelines("%s\n" % line for line in agent_section)
+    return errors
 
 
 #.
@@ -224,9 +1325,15 @@ def main(argv=None):
     opt = parse_arguments(argv)
 
     socket.setdefaulttimeout(opt.timeout)
+    state = AgentState(opt.host_address)
+    trust = None
     try:
-        con = CUCMConnection(opt.host_address, opt.port, opt)
-        output = fetch_data(con, opt)
+        if opt.cache_trust and not opt.no_cert_check:
+            trust = TrustCache(opt.host_address, opt.port, dict(state.get("tls", {})), opt.ca_file)
+        # one connection pool shared by the sessions of all collectors
+        adapter = HTTPAdapter() if trust is None else TrustCacheAdapter(trust)
+        collectors = make_collectors(opt, adapter, trust)
+        errors = fetch_data(collectors, opt, state, trust)
 
     except Exception as exc:
         if opt.debug:
@@ -234,7 +1341,51 @@ def main(argv=None):
         sys.stderr.write("%s\n" % exc)
         return 1
 
-    sys.stdout.writelines("%s\n" % line for line in output)
+    finally:
+        if trust is not None:
+            state["tls"] = trust.snapshot()
+        try:
+            state.save()
+        except OSError as exc:
+            sys.stderr.write("Cannot save agent state: %s\n" % exc)
+
+    for name, error in errors.items():
+        sys.stderr.write("%s: %s\n" % (name, error))
+
+    # without service states the agent has failed, the other sections are optional
+    return 1 if "services" in errors else 0
+
+
+def main_syslog_listener(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    opt = parse_listener_arguments(argv)
+
+    listener = ServiceEventListener(ServiceEventTable(), opt.allow)
+    try:
+        servers = [SyslogUDPServer((opt.bind, opt.port), listener)]
+        if not opt.no_tcp:
+            servers.append(SyslogTCPServer((opt.bind, opt.port), listener))
+    except OSError as exc:
+        if opt.debug:
+            raise
+        sys.stderr.write("%s\n" % exc)
+        return 1
+
+    threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in servers]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            listener.heartbeat()
+            time.sleep(ServiceEventTable.HEARTBEAT)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
 
     return 0
 
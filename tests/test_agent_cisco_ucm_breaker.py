@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""circuit breaker of the Cisco UCM special agent"""
+
+# License: GNU General Public License v2
+
+import json
+
+import pytest
+import requests
+
+from cmk_addons.plugins.cisco.special_agents.agent_cisco_ucm import (
+    CircuitBreaker,
+    CUCMCircuitOpen,
+    CUCMUnauthorized,
+    endpoint_breaker,
+    parse_arguments,
+)
+
+
+class Server:
+    """Counts the queries which reach the server"""
+
+    def __init__(self, exc=None):
+        self.exc = exc
+        self.queries = 0
+
+    def __call__(self):
+        self.queries += 1
+        if self.exc is not None:
+            raise self.exc
+        return "ok"
+
+
+def _call(breaker, server, now):
+    try:
+        return breaker.call(server, now)
+    except (CUCMUnauthorized, CUCMCircuitOpen, requests.exceptions.RequestException) as exc:
+        return exc
+
+
+def test_opens_after_threshold():
+    state = {}
+    server = Server(CUCMUnauthorized("401 Unauthorized"))
+    for now in range(3):
+        assert isinstance(_call(CircuitBreaker(state, 3, 3600, 300), server, now), CUCMUnauthorized)
+    assert server.queries == 3
+
+    result = _call(CircuitBreaker(state, 3, 3600, 300), server, 10)
+    assert isinstance(result, CUCMCircuitOpen)
+    assert "3 consecutive auth errors (last: 401 Unauthorized)" in str(result)
+    assert server.queries == 3
+
+
+def test_success_resets_failures():
+    state = {}
+    _call(CircuitBreaker(state, 3, 3600, 300), Server(CUCMUnauthorized("401")), 0)
+    _call(CircuitBreaker(state, 3, 3600, 300), Server(CUCMUnauthorized("401")), 1)
+    assert _call(CircuitBreaker(state, 3, 3600, 300), Server(), 2) == "ok"
+    assert state["failures"] == 0 and state["opened"] is None
+
+
+@pytest.mark.parametrize("exc, cooldown", [
+    (CUCMUnauthorized("401 Unauthorized"), 3600),
+    (requests.exceptions.ConnectionError("unreachable"), 300),
+])
+def test_cooldown_by_error_kind_and_half_open_probe(exc, cooldown):
+    state = {}
+    failing = Server(exc)
+    for now in range(3):
+        _call(CircuitBreaker(state, 3, 3600, 300), failing, now)
+    opened = state["opened"]
+
+    assert isinstance(_call(CircuitBreaker(state, 3, 3600, 300), failing, opened + cooldown - 1),
+                      CUCMCircuitOpen)
+    assert failing.queries == 3
+
+    # failing probe opens the breaker for another cool-down
+    assert _call(CircuitBreaker(state, 3, 3600, 300), failing, opened + cooldown) is exc
+    assert failing.queries == 4
+    assert state["opened"] == opened + cooldown
+
+    # successful probe closes it
+    assert _call(CircuitBreaker(state, 3, 3600, 300), Server(), opened + 2 * cooldown) == "ok"
+    assert state["opened"] is None
+
+
+def test_threshold_zero_disables():
+    state = {}
+    server = Server(CUCMUnauthorized("401"))
+    for now in range(10):
+        _call(CircuitBreaker(state, 0, 3600, 300), server, now)
+    assert server.queries == 10
+
+
+def test_credentials_change_resets_breaker():
+    state = {}
+    old = parse_arguments(["-u", "api", "-s", "old secret", "cucm1"])
+    for now in range(3):
+        _call(endpoint_breaker(old, state), Server(CUCMUnauthorized("401")), now)
+    assert isinstance(_call(endpoint_breaker(old, state), Server(), 10), CUCMCircuitOpen)
+
+    new = parse_arguments(["-u", "api", "-s", "new secret", "cucm1"])
+    assert _call(endpoint_breaker(new, state), Server(), 11) == "ok"
+    assert "secret" not in json.dumps(state)
+
+
+def test_breakers_per_endpoint():
+    state = {}
+    opt = parse_arguments(["-u", "api", "-s", "secret", "cucm1"])
+    for now in range(3):
+        _call(endpoint_breaker(opt, state, "/axl"), Server(CUCMUnauthorized("401")), now)
+    assert _call(endpoint_breaker(opt, state), Server(), 10) == "ok"
+    assert isinstance(_call(endpoint_breaker(opt, state, "/axl"), Server(), 10), CUCMCircuitOpen)
+    salt = state["breaker"]["salt"]
+    assert endpoint_breaker(opt, state) and state["breaker"]["salt"] == salt
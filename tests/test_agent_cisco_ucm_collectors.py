@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""concurrent collectors of the Cisco UCM special agent"""
+
+# License: GNU General Public License v2
+
+import socket
+import time
+
+import pytest
+
+from cmk_addons.plugins.cisco.special_agents import agent_cisco_ucm
+from cmk_addons.plugins.cisco.special_agents.agent_cisco_ucm import (
+    Collector,
+    CUCMUnauthorized,
+    fetch_data,
+    main,
+    make_collectors,
+    parse_arguments,
+)
+
+SERVICES = [["Cisco Tftp", "Started", "-1", ""]]
+
+
+@pytest.fixture(name="agent")
+def fixture_agent(monkeypatch, tmp_path):
+    monkeypatch.setattr(agent_cisco_ucm, "state_dir", lambda: tmp_path)
+    monkeypatch.setattr(agent_cisco_ucm, "fetch_servicestatus", lambda con: SERVICES)
+    monkeypatch.setattr(agent_cisco_ucm, "fetch_inventory",
+                        lambda axl, opt, now: (["Cisco 7841|sip78xx.14-2|DP0|12"], []))
+    yield monkeypatch
+    socket.setdefaulttimeout(None)
+
+
+def _sections(output):
+    sections = {}
+    for line in output.splitlines():
+        if line.startswith("<<<"):
+            lines = sections.setdefault(line[3:].split(":")[0], [])
+        else:
+            lines.append(line)
+    return sections
+
+
+def _fail(*args):
+    raise CUCMUnauthorized("401 Unauthorized")
+
+
+def test_deadline_argument():
+    opt = parse_arguments(["--deadline", "services=5", "--deadline", "inventory=600", "cucm1"])
+    assert opt.deadline == [("services", 5), ("inventory", 600)]
+    for value in ("foo=10", "services", "services=", "inventory=x", "services=0"):
+        with pytest.raises(SystemExit):
+            parse_arguments(["--deadline", value, "cucm1"])
+
+
+def test_failing_collector_drops_only_its_section(capsys):
+    opt = parse_arguments(["cucm1"])
+    collectors = [
+        Collector("services", 5, lambda state: (["<<<cisco_ucm_services:sep(124)>>>"], []),
+                  _fail),
+        Collector("inventory", 5, _fail, _fail),
+    ]
+    errors = fetch_data(collectors, opt, {})
+    assert errors == {"inventory": "401 Unauthorized"}
+    sections = _sections(capsys.readouterr().out)
+    assert set(sections) == {"cisco_ucm_services", "cisco_ucm_agent"}
+    assert "collector|inventory|failed|401 Unauthorized" in sections["cisco_ucm_agent"]
+
+
+def test_timeout_is_recorded_in_the_breaker(agent, capsys):
+    agent.setattr(agent_cisco_ucm, "fetch_servicestatus", lambda con: time.sleep(3) or SERVICES)
+    opt = parse_arguments(["--inventory", "--deadline", "services=1", "cucm1"])
+    state = {}
+    start = time.monotonic()
+    errors = fetch_data(make_collectors(opt, None, None), opt, state)
+    assert time.monotonic() - start < 2.5
+    assert errors == {"services": "deadline of 1s exceeded"}
+
+    sections = _sections(capsys.readouterr().out)
+    assert sections["cisco_ucm_inventory"] == ["Cisco 7841|sip78xx.14-2|DP0|12"]
+    assert "cisco_ucm_services" not in sections
+    assert "collector|services|timeout|1" in sections["cisco_ucm_agent"]
+
+    breaker = state["services"]["breaker"]["endpoints"]["cucm1:%d" % opt.port]
+    assert breaker["failures"] == 1
+    assert breaker["kind"] == "network"
+    assert breaker["last_error"] == "deadline of 1s exceeded"
+
+
+def test_exit_code(agent, capsys):
+    assert main(["--inventory", "cucm1"]) == 0
+    assert set(_sections(capsys.readouterr().out)) == {
+        "cisco_ucm_services", "cisco_ucm_inventory", "cisco_ucm_agent"}
+
+    # the inventory is optional
+    agent.setattr(agent_cisco_ucm, "fetch_inventory", _fail)
+    assert main(["--inventory", "cucm1"]) == 0
+    captured = capsys.readouterr()
+    assert set(_sections(captured.out)) == {"cisco_ucm_services", "cisco_ucm_agent"}
+    assert captured.err == "inventory: 401 Unauthorized\n"
+
+    agent.setattr(agent_cisco_ucm, "fetch_servicestatus", _fail)
+    assert main(["--inventory", "cucm1"]) == 1
+    captured = capsys.readouterr()
+    assert set(_sections(captured.out)) == {"cisco_ucm_agent"}
+    assert "services: 401 Unauthorized\n" in captured.err
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""AXL inventory of the Cisco UCM special agent, with a local stand-in for the AXL API"""
+
+# License: GNU General Public License v2
+
+import argparse
+import re
+
+import pytest
+import requests
+
+from cmk_addons.plugins.cisco.special_agents import agent_cisco_ucm
+from cmk_addons.plugins.cisco.special_agents.agent_cisco_ucm import (
+    AXLInventory,
+    CUCMFault,
+    fetch_inventory,
+    parse_sql_rows,
+)
+
+
+class FakeAXL:
+    """Answers the inventory queries like executeSQLQuery of CUCM would"""
+
+    def __init__(self, devices, max_rows=None, fail_after=None):
+        # pkid -> (versionstamp, model, special load, default load, device pool)
+        self.devices = devices
+        self.max_rows = max_rows
+        self.fail_after = fail_after
+        self.pages = []
+        self.detailed = []
+
+    def query_sql(self, sql):
+        if self.fail_after is not None:
+            if self.fail_after == 0:
+                raise requests.exceptions.ConnectionError("connection reset")
+            self.fail_after -= 1
+        page = re.search(r"FIRST (\d+) .* d.pkid > '([^']*)'", sql)
+        if page:
+            first, after = int(page.group(1)), page.group(2)
+            if self.max_rows is not None and first > self.max_rows:
+                raise CUCMFault("Query request too large. Total rows matched: %d rows. "
+                                "Suggestive Row Fetch: less than %d rows" %
+                                (len(self.devices), self.max_rows))
+            self.pages.append((after, first))
+            rows = [
+                "<row><pkid>%s</pkid><versionstamp>%s</versionstamp></row>" %
+                (pkid, self.devices[pkid][0])
+                for pkid in sorted(pkid for pkid in self.devices if pkid > after)[:first]
+            ]
+        else:
+            pkids = re.findall(r"'([^']*)'", sql)
+            self.detailed += pkids
+            rows = [
+                "<row><pkid>%s</pkid><model>%s</model>%s<defaultload>%s</defaultload>"
+                "<devicepool>%s</devicepool></row>" %
+                (pkid, model, "<fwload>%s</fwload>" % load if load else "<fwload/>", default_load,
+                 devicepool)
+                for pkid in pkids
+                for _version, model, load, default_load, devicepool in [self.devices[pkid]]
+                if model  # INNER JOIN typemodel finds no match
+            ]
+        return parse_sql_rows("<return>%s</return>" % "".join(rows))
+
+
+def _devices(count):
+    return {
+        "pkid-%05d" % i: ("1", "Cisco 88%02d" % (45 + i % 2), "", "sip88xx.14-2", "DP%d" % (i % 3))
+        for i in range(count)
+    }
+
+
+def test_parse_sql_rows():
+    assert parse_sql_rows("<return><row><pkid>p1</pkid><model>Cisco 7841</model>"
+                          "<fwload/><devicepool>A &amp; B</devicepool></row>"
+                          "<row><pkid>p2</pkid><fwload>custom</fwload></row></return>") == [
+                              {"pkid": "p1", "model": "Cisco 7841", "fwload": "", "devicepool": "A & B"},
+                              {"pkid": "p2", "fwload": "custom"},
+                          ]
+
+
+def test_paging():
+    axl = FakeAXL(_devices(2345))
+    devices = {}
+    assert AXLInventory(axl, devices, 500).collect() == 2345
+    assert len(devices) == 2345
+    offset = 0
+    for after, first in axl.pages:
+        assert after == ("pkid-%05d" % (offset - 1) if offset else "")
+        offset += min(first, 2345 - offset)
+    assert offset == 2345
+    assert devices["pkid-00000"] == ["1", "Cisco 8845", "sip88xx.14-2", "DP0"]
+
+
+def test_halving_on_too_large():
+    axl = FakeAXL(_devices(1000), max_rows=300)
+    devices = {}
+    inventory = AXLInventory(axl, devices, 1000)
+    assert inventory.collect() == 1000
+    assert len(devices) == 1000
+    assert all(first <= 300 for _after, first in axl.pages)
+    assert inventory.chunk <= 300
+
+
+def test_too_large_at_minimum_chunk():
+    axl = FakeAXL(_devices(10), max_rows=AXLInventory.MIN_CHUNK - 1)
+    with pytest.raises(CUCMFault):
+        AXLInventory(axl, {}, AXLInventory.MIN_CHUNK).collect()
+
+
+def test_second_run_queries_changed_rows_only():
+    axl = FakeAXL(_devices(300))
+    devices = {}
+    AXLInventory(axl, devices, 1000).collect()
+
+    axl.devices["pkid-00001"] = ("2", "Cisco 7841", "custom-load", "sip78xx.14", "DP9")
+    axl.devices["pkid-99999"] = ("1", "Cisco 8865", "", "sip8845_65.14", "DP1")
+    del axl.devices["pkid-00002"]
+    axl.detailed = []
+    assert AXLInventory(axl, devices, 1000).collect() == 2
+    assert sorted(axl.detailed) == ["pkid-00001", "pkid-99999"]
+    assert devices["pkid-00001"] == ["2", "Cisco 7841", "custom-load", "DP9"]
+    assert "pkid-00002" not in devices
+    assert len(devices) == 300
+
+
+def test_unresolved_device_is_not_queried_again():
+    axl = FakeAXL(_devices(5))
+    axl.devices["pkid-00003"] = ("1", "", "", "", "")
+    devices = {}
+    assert AXLInventory(axl, devices, 1000).collect() == 5
+    assert devices["pkid-00003"] == ["1", "", "", ""]
+
+    axl.detailed = []
+    assert AXLInventory(axl, devices, 1000).collect() == 0
+    assert axl.detailed == []
+
+
+def _opt(monkeypatch, tmp_path):
+    monkeypatch.setattr(agent_cisco_ucm, "state_dir", lambda: tmp_path)
+    return argparse.Namespace(host_address="cucm1", axl_chunk=100, inventory_interval=3600)
+
+
+def test_fetch_inventory(monkeypatch, tmp_path):
+    opt = _opt(monkeypatch, tmp_path)
+    axl = FakeAXL(_devices(6))
+    axl.devices["pkid-00005"] = ("1", "", "", "", "")
+
+    section, agent_section = fetch_inventory(axl, opt, 10000)
+    assert section == [
+        "Cisco 8845|sip88xx.14-2|DP0|1",
+        "Cisco 8845|sip88xx.14-2|DP1|1",
+        "Cisco 8845|sip88xx.14-2|DP2|1",
+        "Cisco 8846|sip88xx.14-2|DP0|1",
+        "Cisco 8846|sip88xx.14-2|DP1|1",
+    ]
+    assert "inventory|changed|6" in agent_section
+    assert "inventory|unresolved|1" in agent_section
+
+    # within the interval the cached inventory is reported without any query
+    axl.pages = []
+    assert fetch_inventory(axl, opt, 10060)[0] == section
+    assert axl.pages == []
+
+
+def test_interrupted_crawl_resumes(monkeypatch, tmp_path):
+    opt = _opt(monkeypatch, tmp_path)
+    monkeypatch.setattr(AXLInventory, "TARGET", 0)  # keep the chunk at MIN_CHUNK
+    axl = FakeAXL(_devices(450), fail_after=3)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        fetch_inventory(axl, opt, 10000)
+    assert axl.pages == [("", 100), ("pkid-00099", 100), ("pkid-00199", 100)]
+
+    axl.pages = []
+    axl.fail_after = 5
+    with pytest.raises(requests.exceptions.ConnectionError):
+        fetch_inventory(axl, opt, 10000 + AXLInventory.RETRY)
+    # the versions are complete, the details of the first 300 devices are kept
+    assert axl.pages == [("pkid-00299", 100), ("pkid-00399", 100)]
+    assert len(axl.detailed) == 300
+
+    axl.pages = []
+    axl.detailed = []
+    axl.fail_after = None
+    section, agent_section = fetch_inventory(axl, opt, 10000 + 3 * AXLInventory.RETRY)
+    assert axl.pages == []
+    assert axl.detailed == ["pkid-%05d" % i for i in range(300, 450)]
+    assert sum(int(line.split("|")[-1]) for line in section) == 450
+    assert "inventory|changed|450" in agent_section
+    assert "inventory|age|0" in agent_section
+
+
+def test_failed_crawl_backs_off(monkeypatch, tmp_path):
+    opt = _opt(monkeypatch, tmp_path)
+    axl = FakeAXL(_devices(10), fail_after=0)
+    now = 10000
+    for attempt in range(1, 8):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            fetch_inventory(axl, opt, now)
+        backoff = min(AXLInventory.RETRY * 2**(attempt - 1), opt.inventory_interval)
+        # a crawl abandoned at its deadline has the same back-off: the attempt is recorded first
+        section, agent_section = fetch_inventory(axl, opt, now + backoff - 1)
+        assert section == []
+        assert "inventory|attempts|%d" % attempt in agent_section
+        now += backoff
+    assert backoff == opt.inventory_interval
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""adaptive polling of the Cisco UCM special agent"""
+
+# License: GNU General Public License v2
+
+import time
+
+import pytest
+
+from cmk_addons.plugins.cisco.special_agents import agent_cisco_ucm
+from cmk_addons.plugins.cisco.special_agents.agent_cisco_ucm import (
+    AdaptivePolling,
+    collect_services,
+    CUCMCircuitOpen,
+    CUCMUnauthorized,
+    parse_arguments,
+)
+
+SERVICES = [["Cisco Tftp", "Started", "-1", ""]]
+
+
+def _opt(*args):
+    return parse_arguments(["--adaptive-polling", *args, "cucm1"])
+
+
+def _ok():
+    return SERVICES
+
+
+def _slow():
+    time.sleep(0.05)
+    return SERVICES
+
+
+def _failing():
+    raise CUCMUnauthorized("401 Unauthorized")
+
+
+def _fetch(state, opt, query, now):
+    polling = AdaptivePolling(state, opt)
+    try:
+        return polling, polling.fetch(query, now)
+    except CUCMUnauthorized:
+        return polling, None
+
+
+def test_polls_every_run_when_healthy():
+    state = {}
+    opt = _opt()
+    for now in (0, 60, 120):
+        polling, data = _fetch(state, opt, _ok, now)
+        assert data == SERVICES
+        assert not polling.cached
+    assert state["interval"] == 0
+
+
+def test_backoff_on_latency_and_recovery():
+    state = {}
+    opt = _opt("--backoff-latency", "0.01")
+    polling, _data = _fetch(state, opt, _slow, 1000)
+    assert state["interval"] == AdaptivePolling.STEP
+
+    polling, data = _fetch(state, opt, _ok, 1030)
+    assert polling.cached and data == SERVICES
+    assert "polling|cache_age|30" in polling.section(1030)
+
+    # once the slow sample left the history, the interval is halved back to zero
+    now = 1030
+    for _run in range(2 * AdaptivePolling.HISTORY):
+        now += 1000
+        polling, _data = _fetch(state, opt, _ok, now)
+        assert not polling.cached
+    assert state["interval"] == 0
+
+
+def test_backoff_on_error_rate():
+    state = {}
+    opt = _opt("--backoff-error-rate", "0.3")
+    _fetch(state, opt, _ok, 0)
+    _fetch(state, opt, _failing, 10)
+    assert state["interval"] == AdaptivePolling.STEP
+    polling, data = _fetch(state, opt, _failing, 20)
+    assert polling.cached and data == SERVICES
+    assert polling.polled_at == 0
+
+
+def test_failed_polls_do_not_refresh_the_cache():
+    state = {}
+    opt = _opt("--backoff-error-rate", "0.3", "--max-interval", "600")
+    _fetch(state, opt, _ok, 0)
+    served = []
+    for now in range(1000, 1700, 30):
+        polling, data = _fetch(state, opt, _failing, now)
+        if data is not None:
+            served.append(now)
+            assert polling.polled_at == 0
+            assert "polling|cache_age|%d" % now in polling.section(now)
+    # data polled at 0 is never served after --max-interval
+    assert all(now <= 600 for now in served)
+
+
+def test_circuit_open_is_not_a_sample():
+    state = {}
+
+    def refused():
+        raise CUCMCircuitOpen("open")
+
+    with pytest.raises(CUCMCircuitOpen):
+        AdaptivePolling(state, _opt()).fetch(refused, 0)
+    assert state["history"] == []
+
+
+def test_cached_header(monkeypatch):
+    monkeypatch.setattr(agent_cisco_ucm, "fetch_servicestatus", lambda con: _slow())
+    opt = _opt("--backoff-latency", "0.01", "--max-interval", "300")
+    state = {}
+    output, _agent_section = collect_services(opt, None, None, state)
+    assert output[0] == "<<<cisco_ucm_services:sep(124)>>>"
+    cached_at = state["polling"]["cached_at"]
+    output, _agent_section = collect_services(opt, None, None, state)
+    assert output == [
+        "<<<cisco_ucm_services:sep(124):cached(%d,300)>>>" % cached_at,
+        "Cisco Tftp|Started|-1|",
+    ]
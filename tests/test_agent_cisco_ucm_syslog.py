@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""syslog listener of the Cisco UCM special agent, with a local syslog sender as CUCM"""
+
+# License: GNU General Public License v2
+
+import ipaddress
+import socket
+import threading
+import time
+
+import pytest
+
+from cmk_addons.plugins.cisco.special_agents.agent_cisco_ucm import (
+    apply_service_events,
+    parse_listener_arguments,
+    parse_service_alarm,
+    ServiceEventListener,
+    ServiceEventTable,
+    SyslogTCPServer,
+    SyslogUDPServer,
+)
+
+STOPPED = ("<187>12: cucm1: Jan 10 2024 10:00:00.123 UTC :  %UC_GENERIC-3-ServiceStopped: "
+           "%[ServiceName=Cisco Tftp][ClusterID=StandAloneCluster][NodeID=cucm1]: Service stopped")
+STARTED = ("<190>13: cucm1: Jan 10 2024 10:00:01.456 UTC :  %UC_GENERIC-6-ServiceStarted: "
+           "%[ServiceName=Cisco CallManager][ProcessID=4711][NodeID=cucm1]: Service started")
+START_FAILED = ("<187>14: cucm2: Jan 10 2024 10:00:02.789 UTC :  %UC_GENERIC-3-ServiceStartFailed: "
+                "%[ServiceName=Cisco CTIManager][NodeID=cucm2]: Service start failed")
+LOCALHOST = [ipaddress.ip_network("127.0.0.0/8")]
+
+
+@pytest.fixture(name="table")
+def fixture_table(tmp_path):
+    return ServiceEventTable(tmp_path / "service_events.json")
+
+
+@pytest.fixture(name="servers")
+def fixture_servers(table):
+    listener = ServiceEventListener(table, LOCALHOST)
+    servers = [
+        SyslogUDPServer(("127.0.0.1", 0), listener),
+        SyslogTCPServer(("127.0.0.1", 0), listener),
+    ]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _wait_for(table, count):
+    for _ in range(50):
+        nodes = table.load().get("nodes", {})
+        if sum(len(entry["services"]) for entry in nodes.values()) >= count:
+            return nodes
+        time.sleep(0.05)
+    raise AssertionError("listener did not record %d services" % count)
+
+
+def test_parse_service_alarm():
+    assert parse_service_alarm(STOPPED) == ("cucm1", "Cisco Tftp", "Stopped", "-1", "")
+    assert parse_service_alarm(START_FAILED) == (
+        "cucm2", "Cisco CTIManager", "Stopped", "1", "Service start failed")
+    assert parse_service_alarm("%UC_GENERIC-6-DeviceRegistered: %[DeviceName=SEP0011]") is None
+    assert parse_service_alarm("%UC_GENERIC-3-ServiceStopped: %[NodeID=cucm1]") is None
+
+
+def test_listener_udp_and_tcp(table, servers):
+    udp_server, tcp_server = servers
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(STOPPED.encode(), udp_server.server_address)
+    with socket.create_connection(tcp_server.server_address) as sock:
+        sock.sendall(("%s\n%s\nnot an alarm\n" % (STARTED, START_FAILED)).encode())
+
+    nodes = _wait_for(table, 3)
+    assert set(nodes) == {"cucm1", "cucm2"}
+    assert nodes["cucm1"]["address"] == "127.0.0.1"
+    assert {name: entry[0] for name, entry in nodes["cucm1"]["services"].items()} == {
+        "Cisco Tftp": "Stopped",
+        "Cisco CallManager": "Started",
+    }
+    assert nodes["cucm2"]["services"]["Cisco CTIManager"][:3] == [
+        "Stopped", "1", "Service start failed"]
+
+    assert set(table.lookup("cucm1.example.com")) == {"Cisco Tftp", "Cisco CallManager"}
+    assert set(table.lookup("CUCM2")) == {"Cisco CTIManager"}
+    assert table.lookup("cucm3.example.com") == {}
+
+
+def test_lookup_needs_heartbeat(table):
+    listener = ServiceEventListener(table, [ipaddress.ip_network("192.0.2.0/28")])
+    listener.handle(STOPPED, "192.0.2.1", now=1000)
+    assert table.lookup("cucm1", now=1000 + ServiceEventTable.HEARTBEAT) is not None
+    assert table.lookup("cucm1", now=1000 + 4 * ServiceEventTable.HEARTBEAT) is None
+    listener.heartbeat(now=2000)
+    assert table.lookup("cucm1", now=2000) is not None
+    assert ServiceEventTable(table._path.with_name("missing.json")).lookup("cucm1") is None
+
+
+def test_unknown_senders_are_dropped(table, servers):
+    udp_server, tcp_server = servers
+    listener = udp_server.listener
+    listener.handle(STARTED, "192.0.2.1", now=1000)
+    assert table.load().get("nodes", {}) == {}
+
+    listener.handle(STARTED, "::ffff:127.0.0.1", now=1000)
+    assert set(_wait_for(table, 1)) == {"cucm1"}
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.sendto(STOPPED.encode(), udp_server.server_address)
+    assert _wait_for(table, 2)["cucm1"]["services"]["Cisco Tftp"][0] == "Stopped"
+
+    assert not tcp_server.verify_request(None, ("192.0.2.1", 514))
+    assert tcp_server.verify_request(None, ("127.0.0.1", 514))
+
+
+def test_listener_arguments():
+    assert parse_listener_arguments(["-a", "192.0.2.1", "--allow", "198.51.100.0/24"]).allow == [
+        ipaddress.ip_network("192.0.2.1/32"),
+        ipaddress.ip_network("198.51.100.0/24"),
+    ]
+    with pytest.raises(SystemExit):
+        parse_listener_arguments([])
+    with pytest.raises(SystemExit):
+        parse_listener_arguments(["--allow", "cucm1"])
+
+
+def test_apply_service_events_since():
+    servicestatus = [["Cisco Tftp", "Started", "-1", ""], ["Cisco CallManager", "Started", "-1", ""]]
+    events = {
+        "Cisco Tftp": ["Stopped", "-1", "", 100],
+        "Cisco CallManager": ["Stopped", "-1", "", 300],
+        "Cisco CTIManager": ["Stopped", "1", "Service start failed", 300],
+    }
+    assert apply_service_events(servicestatus, events, 200) == [
+        ["Cisco Tftp", "Started", "-1", ""],
+        ["Cisco CallManager", "Stopped", "-1", ""],
+        ["Cisco CTIManager", "Stopped", "1", "Service start failed"],
+    ]
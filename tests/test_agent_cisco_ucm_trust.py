@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""TLS trust cache of the Cisco UCM special agent, with a local TLS server as CUCM
+
+tests/data holds a test CA and a server certificate for localhost signed by it.
+"""
+
+# License: GNU General Public License v2
+
+import os
+import shutil
+import socket
+import ssl
+import threading
+from pathlib import Path
+
+import pytest
+import requests
+
+from cmk_addons.plugins.cisco.special_agents import agent_cisco_ucm
+from cmk_addons.plugins.cisco.special_agents.agent_cisco_ucm import CUCMSession, TrustCache
+
+DATA = Path(__file__).parent / "data"
+
+
+@pytest.fixture(name="server")
+def fixture_server():
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(DATA / "server.pem")
+    sock = socket.create_server(("127.0.0.1", 0))
+    stop = threading.Event()
+
+    def serve():
+        while not stop.is_set():
+            try:
+                conn, _address = sock.accept()
+            except OSError:
+                return
+            try:
+                with context.wrap_socket(conn, server_side=True):
+                    pass
+            except (OSError, ssl.SSLError):
+                conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield sock.getsockname()[1]
+    stop.set()
+    sock.close()
+
+
+@pytest.fixture(name="ca_file")
+def fixture_ca_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(agent_cisco_ucm, "state_dir", lambda: tmp_path)
+    ca_file = tmp_path / "ca.pem"
+    shutil.copy(DATA / "ca.pem", ca_file)
+    return str(ca_file)
+
+
+def _handshake(trust, port):
+    context = trust.context()  # may pin, before the connection blocks the server
+    with socket.create_connection(("localhost", port)) as sock:
+        context.wrap_socket(sock, server_hostname="localhost").close()
+
+
+def _run(state, port, ca_file):
+    trust = TrustCache("localhost", port, state, ca_file)
+    _handshake(trust, port)
+    return trust, dict(line.split("|")[1:] for line in trust.section())
+
+
+def test_pin_and_reuse(server, ca_file):
+    trust, section = _run({}, server, ca_file)
+    assert section["trust"] == "pinned new"
+    assert "handshake_ms" in section
+    assert "saved_ms" not in section
+    assert trust.path.read_text().startswith("-----BEGIN CERTIFICATE-----")
+
+    trust, section = _run(trust.snapshot(), server, ca_file)
+    assert section["trust"] == "pinned"
+    assert "saved_ms" in section
+
+
+def test_pin_again_when_ca_bundle_changes(server, ca_file):
+    trust, _section = _run({}, server, ca_file)
+    state = trust.snapshot()
+    assert state["ca"] == [ca_file, os.stat(ca_file).st_mtime]
+
+    os.utime(ca_file, (0, 0))
+    trust, section = _run(state, server, ca_file)
+    assert section["trust"] == "pinned new"
+    assert trust.snapshot()["ca"] == [ca_file, 0]
+
+    trust, section = _run(trust.snapshot(), server, str(DATA / "ca.pem"))
+    assert section["trust"] == "pinned new"
+
+
+def test_pin_needs_trusted_certificate(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(agent_cisco_ucm, "state_dir", lambda: tmp_path)
+    # the public CAs of certifi did not sign the test server certificate
+    with pytest.raises(ssl.SSLCertVerificationError):
+        TrustCache("localhost", server, {}, requests.certs.where()).context()
+    assert not (tmp_path / ("localhost_%d.pem" % server)).exists()
+
+
+def test_ca_file_without_trust_cache():
+    assert CUCMSession("cucm1", 8443, ca_file="/etc/cucm-ca.pem").verify == "/etc/cucm-ca.pem"
+    assert CUCMSession("cucm1", 8443).verify is True
+    assert CUCMSession("cucm1", 8443, no_cert_check=True, ca_file="/etc/cucm-ca.pem").verify is False
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""inventory plugin of the phones reported by the Cisco UCM special agent"""
+
+# License: GNU General Public License v2
+
+import pytest
+
+v2 = pytest.importorskip("cmk.agent_based.v2")
+
+from cmk_addons.plugins.cisco.agent_based.cisco_ucm_inventory import (  # noqa: E402
+    CUCMPhones,
+    inventory_cisco_ucm_inventory,
+    parse_cisco_ucm_inventory,
+)
+
+STRING_TABLE = [
+    ["Cisco 7841", "sip78xx.14-2", "DP0", "12"],
+    ["Cisco 8845", "custom-load", "DP1", "1"],
+]
+
+
+def test_parse_cisco_ucm_inventory():
+    assert parse_cisco_ucm_inventory(STRING_TABLE) == [
+        CUCMPhones("Cisco 7841", "sip78xx.14-2", "DP0", 12),
+        CUCMPhones("Cisco 8845", "custom-load", "DP1", 1),
+    ]
+
+
+def test_inventory_cisco_ucm_inventory():
+    assert list(inventory_cisco_ucm_inventory(parse_cisco_ucm_inventory(STRING_TABLE))) == [
+        v2.TableRow(
+            path=["software", "applications", "cisco_ucm", "phones"],
+            key_columns={"model": "Cisco 7841", "firmware": "sip78xx.14-2", "devicepool": "DP0"},
+            inventory_columns={"count": 12},
+        ),
+        v2.TableRow(
+            path=["software", "applications", "cisco_ucm", "phones"],
+            key_columns={"model": "Cisco 8845", "firmware": "custom-load", "devicepool": "DP1"},
+            inventory_columns={"count": 1},
+        ),
+    ]
+
+
+def test_empty_inventory():
+    assert list(inventory_cisco_ucm_inventory(parse_cisco_ucm_inventory([]))) == []